@@ -2,10 +2,18 @@
 # (by running `make templates` in `core`)
 # do not edit manually!
 
-# NOTE: using positional arguments saves 520 bytes in flash space
+# NOTE: the table is stored as one packed bytes blob to save flash space
+#
+# this module is frozen into the firmware image; keep the tables as bytes
+# and str/tuple constants so that the freezer can leave them in flash
+# instead of copying them to the heap at import time
+
+from micropython import const
 
 
 class FIDOApp:
+    __slots__ = ("label", "icon_name", "use_sign_count", "use_self_attestation")
+
     def __init__(
         self,
         label: str,
@@ -33,18 +41,119 @@ for app in fido:
         app.icon_name = app.key
     else:
         app.icon_name = None
+
+# sorted by rp_id_hash to keep the generated table order stable
+fido_entries.sort(key=lambda entry: entry[1])
+
+# build a perfect hash over the first 4 bytes of the hashes: search for a
+# 32-bit multiplier that maps every known hash to a distinct slot of a
+# small table, growing the table if no multiplier is found
+hash_prefixes = [int.from_bytes(h[:4], "big") for _, h, _, _ in fido_entries]
+assert len(set(hash_prefixes)) == len(fido_entries), "rp_id_hash prefix collision"
+num_slots = 128
+seed = None
+while seed is None:
+    shift = 32 - (num_slots.bit_length() - 1)
+    for candidate in range(1, 1 << 20, 2):
+        slots = {(p * candidate & 0xFFFFFFFF) >> shift for p in hash_prefixes}
+        if len(slots) == len(hash_prefixes):
+            seed = candidate
+            break
+    else:
+        num_slots *= 2
+assert len(fido_entries) <= 0xFF, "record index overflow"
+# empty slots point at record 0: an input landing on an empty slot cannot
+# equal any known hash (record 0's own hash maps to its own slot), so the
+# full-hash verification rejects it without a separate sentinel check
+slot_table = bytearray(num_slots)
+for i, prefix in enumerate(hash_prefixes):
+    slot_table[(prefix * seed & 0xFFFFFFFF) >> shift] = i
+
+# deduplicate labels and icon names into small pools referenced by index
+TRISTATE = {None: 0, False: 1, True: 2}
+labels = []
+icons = [None]
+records = []
+for label, rp_id_hash, type, app in fido_entries:
+    if label not in labels:
+        labels.append(label)
+    if app.icon_name not in icons:
+        icons.append(app.icon_name)
+    records.append(
+        rp_id_hash
+        + bytes(
+            (
+                labels.index(label),
+                icons.index(app.icon_name),
+                TRISTATE[app.use_sign_count] | TRISTATE[app.use_self_attestation] << 2,
+            )
+        )
+    )
+assert len(labels) <= 0xFF, "label pool overflow"
+assert len(icons) <= 0xFF, "icon pool overflow"
 %>\
 # fmt: off
-def by_rp_id_hash(rp_id_hash: bytes) -> FIDOApp | None:
-% for label, rp_id_hash, type, app in fido_entries:
-    if rp_id_hash == ${black_repr(rp_id_hash)}:
-        # ${type} key for ${app.name}
-        return FIDOApp(
-            ${black_repr(label)},  # label
-            ${black_repr(app.icon_name)},  # icon_name
-            ${black_repr(app.use_sign_count)},  # use_sign_count
-            ${black_repr(app.use_self_attestation)},  # use_self_attestation
-        )
+# label and icon name pools, referenced by index from the records in _BLOB
+_LABELS: tuple[str, ...] = (
+% for label in labels:
+    ${black_repr(label)},
+% endfor
+)
+_ICONS: tuple[str | None, ...] = (
+% for icon_name in icons:
+    ${black_repr(icon_name)},
 % endfor
+)
+# 35-byte records sorted by hash: the 32-byte rp_id_hash followed by a
+# label index, an icon index and a flags byte holding the two tri-state
+# flags in its low and high bit pairs (see _TRISTATE)
+_BLOB = (
+% for (label, rp_id_hash, type, app), record in zip(fido_entries, records):
+    # ${type} key for ${app.name}
+    ${black_repr(record)}
+% endfor
+)
+# maps the perfect hash of the first 4 bytes of rp_id_hash to a record
+# index in _BLOB (empty slots point at record 0 and fail verification);
+# _SEED was searched for at template render time so that every known hash
+# lands in a distinct slot
+_SLOTS = ${black_repr(bytes(slot_table))}
+# fmt: on
+
+_SEED = const(${seed})
+_SHIFT = const(${shift})
+_RECORD = const(35)
+_TRISTATE = (None, False, True)
+
+# WebAuthn flows look up the same RP ID hash several times during one
+# operation, so the last lookup result is kept and handed out again; this
+# covers misses as well, since most RP IDs hitting the device are not in
+# the table at all
+_last_lookup: tuple[bytes, FIDOApp | None] | None = None
 
-    return None
+
+def by_rp_id_hash(rp_id_hash: bytes) -> FIDOApp | None:
+    global _last_lookup
+
+    if _last_lookup is not None and _last_lookup[0] == rp_id_hash:
+        return _last_lookup[1]
+
+    # perfect-hash probe: the multiplier maps every known hash to its own
+    # slot, so one table load finds the only possible candidate, whose full
+    # hash is then verified
+    x = int.from_bytes(rp_id_hash[:4], "big")
+    o = _SLOTS[(x * _SEED & 0xFFFF_FFFF) >> _SHIFT] * _RECORD
+    # comparing one byte first avoids allocating the 32-byte slice for
+    # candidates that cannot match
+    if _BLOB[o] != rp_id_hash[0] or _BLOB[o : o + 32] != rp_id_hash:
+        app = None
+    else:
+        flags = _BLOB[o + 34]
+        app = FIDOApp(
+            _LABELS[_BLOB[o + 32]],  # label
+            _ICONS[_BLOB[o + 33]],  # icon_name
+            _TRISTATE[flags & 3],  # use_sign_count
+            _TRISTATE[flags >> 2],  # use_self_attestation
+        )
+    _last_lookup = (rp_id_hash, app)
+    return app